@@ -34,3 +34,4 @@ with app.app_context():
     import models  # noqa: F401
     db.create_all()
     logging.info("Database tables created")
+    models.init_default_categories()
@@ -2,7 +2,8 @@ from datetime import datetime
 from app import db
 from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
 from flask_login import UserMixin
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import insert
 
 # (IMPORTANT) This table is mandatory for Replit Auth, don't drop it.
 class User(UserMixin, db.Model):
@@ -17,7 +18,7 @@ class User(UserMixin, db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
     # Relationship with transactions
-    transactions = db.relationship('Transaction', backref='user', lazy=True, cascade='all, delete-orphan')
+    transactions = db.relationship('Transaction', back_populates='user', lazy='select', cascade='all, delete-orphan')
 
 # (IMPORTANT) This table is mandatory for Replit Auth, don't drop it.
 class OAuth(OAuthConsumerMixin, db.Model):
@@ -32,6 +33,9 @@ class OAuth(OAuthConsumerMixin, db.Model):
         name='uq_user_browser_session_key_provider',
     ),)
 
+# Transaction kind, stored as a Postgres ENUM
+transaction_type_enum = db.Enum('income', 'expense', name='tx_type')
+
 # Transaction model for financial tracking
 class Transaction(db.Model):
     __tablename__ = 'transactions'
@@ -40,14 +44,27 @@ class Transaction(db.Model):
     
     title = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
-    transaction_type = db.Column(db.String(20), nullable=False)  # 'income' or 'expense'
-    category = db.Column(db.String(50), nullable=False)
+    transaction_type = db.Column(transaction_type_enum, nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
     description = db.Column(db.Text)
     
-    transaction_date = db.Column(db.Date, nullable=False, default=datetime.now().date)
+    transaction_date = db.Column(db.Date, nullable=False, default=lambda: datetime.now().date())
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    user = db.relationship('User', back_populates='transactions')
+    category = db.relationship('Category')
+
+    __table_args__ = (
+        db.Index('ix_tx_user_date', 'user_id', 'transaction_date', 'id'),
+        db.Index('ix_tx_user_cat', 'user_id', 'category_id'),
+        # Partial indexes keep income-only and expense-only scans small
+        db.Index('ix_tx_income_user_date', 'user_id', 'transaction_date', 'id',
+                 postgresql_where=text("transaction_type = 'income'")),
+        db.Index('ix_tx_expense_user_date', 'user_id', 'transaction_date', 'id',
+                 postgresql_where=text("transaction_type = 'expense'")),
+    )
+
 # Category model for predefined transaction categories
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -59,3 +76,43 @@ class Category(db.Model):
 
     def __repr__(self):
         return f'<Category {self.name}>'
+
+# Initialize default categories
+def init_default_categories():
+    """Initialize default transaction categories if they don't exist"""
+    default_categories = [
+        # Categorias de Receita
+        ('Salário', 'income', 'briefcase'),
+        ('Freelance', 'income', 'edit-3'),
+        ('Investimentos', 'income', 'trending-up'),
+        ('Presentes', 'income', 'gift'),
+        ('Outras Receitas', 'income', 'plus'),
+        
+        # Categorias de Despesas
+        ('Alimentação', 'expense', 'coffee'),
+        ('Transporte', 'expense', 'truck'),
+        ('Compras', 'expense', 'shopping-bag'),
+        ('Entretenimento', 'expense', 'film'),
+        ('Contas e Utilidades', 'expense', 'zap'),
+        ('Saúde', 'expense', 'heart'),
+        ('Educação', 'expense', 'book'),
+        ('Viagens', 'expense', 'map-pin'),
+        ('Outras Despesas', 'expense', 'minus'),
+    ]
+    
+    # Usual boots find every default already present and stay read-only; missing names go in
+    # as one INSERT that skips any another worker seeded in the meantime
+    default_names = [name for name, _, _ in default_categories]
+    existing = {row[0] for row in db.session.query(Category.name)
+                .filter(Category.name.in_(default_names)).all()}
+    missing = [
+        {'name': name, 'category_type': category_type, 'icon': icon}
+        for name, category_type, icon in default_categories
+        if name not in existing
+    ]
+    
+    if missing:
+        db.session.execute(
+            insert(Category).values(missing).on_conflict_do_nothing(index_elements=['name'])
+        )
+        db.session.commit()
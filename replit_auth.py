@@ -96,7 +96,6 @@ def make_replit_blueprint():
     def set_applocal_session():
         if '_browser_session_key' not in session:
             session['_browser_session_key'] = uuid.uuid4().hex
-        session.modified = True
         g.browser_session_key = session['_browser_session_key']
         g.flask_dance_replit = replit_bp.session
 
@@ -136,6 +135,8 @@ def logged_in(blueprint, token):
     user_claims = jwt.decode(token['id_token'], options={"verify_signature": False})
     user = save_user(user_claims)
     login_user(user)
+    # Flask keeps this flag in the session cookie, so setting it once at login is enough
+    session.permanent = True
     blueprint.token = token
     next_url = session.pop("next_url", None)
     if next_url is not None:
@@ -1,8 +1,9 @@
-from flask import render_template, request, redirect, url_for, flash, session
+from flask import render_template, request, redirect, url_for, flash, abort
 from flask_login import current_user
-from datetime import datetime, timedelta
+from datetime import datetime
 from decimal import Decimal
-from sqlalchemy import extract, func, desc
+from sqlalchemy import Date, Float, case, cast, func, desc, tuple_
+from sqlalchemy.orm import joinedload, raiseload
 from app import app, db
 from models import Transaction, Category, User
 from replit_auth import require_login, make_replit_blueprint
@@ -10,54 +11,75 @@ from replit_auth import require_login, make_replit_blueprint
 # Register the authentication blueprint
 app.register_blueprint(make_replit_blueprint(), url_prefix="/auth")
 
-# Make session permanent
-@app.before_request
-def make_session_permanent():
-    session.permanent = True
+# Categories rarely change, so keep them in memory instead of querying per request
+categories_cache = None
 
-# Initialize default categories
-def init_default_categories():
-    """Initialize default transaction categories if they don't exist"""
-    default_categories = [
-        # Categorias de Receita
-        ('Salário', 'income', 'briefcase'),
-        ('Freelance', 'income', 'edit-3'),
-        ('Investimentos', 'income', 'trending-up'),
-        ('Presentes', 'income', 'gift'),
-        ('Outras Receitas', 'income', 'plus'),
-        
-        # Categorias de Despesas
-        ('Alimentação', 'expense', 'coffee'),
-        ('Transporte', 'expense', 'truck'),
-        ('Compras', 'expense', 'shopping-bag'),
-        ('Entretenimento', 'expense', 'film'),
-        ('Contas e Utilidades', 'expense', 'zap'),
-        ('Saúde', 'expense', 'heart'),
-        ('Educação', 'expense', 'book'),
-        ('Viagens', 'expense', 'map-pin'),
-        ('Outras Despesas', 'expense', 'minus'),
-    ]
-    
-    for name, category_type, icon in default_categories:
-        if not Category.query.filter_by(name=name).first():
-            category = Category()
-            category.name = name
-            category.category_type = category_type
-            category.icon = icon
-            db.session.add(category)
-    
-    db.session.commit()
+def get_categories():
+    """Return all categories as lightweight rows, loading them once per process"""
+    global categories_cache
+    if categories_cache is None:
+        categories_cache = db.session.query(
+            Category.id,
+            Category.name,
+            Category.category_type,
+            Category.icon
+        ).order_by(Category.id).all()
+    return categories_cache
+
+TRANSACTION_TYPES = ('income', 'expense')
+MAX_AMOUNT = Decimal('1e8')
 
-# Track if categories are initialized
-categories_initialized = False
+def is_category(category_id):
+    """Check that category_id refers to an existing category"""
+    return any(category.id == category_id for category in get_categories())
 
-# Initialize categories on first request
-@app.before_request
-def initialize_app():
-    global categories_initialized
-    if not categories_initialized:
-        init_default_categories()
-        categories_initialized = True
+def parse_date(value):
+    """Parse a YYYY-MM-DD string into a date"""
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def parse_transaction_form(form):
+    """Validate a submitted transaction form, returning (fields, error message)"""
+    title = form.get('title', '').strip()
+    amount = form.get('amount', '').strip()
+    transaction_type = form.get('transaction_type', '').strip()
+    category_id = form.get('category_id', type=int)
+    description = form.get('description', '').strip()
+    transaction_date = form.get('transaction_date', '').strip()
+    
+    # Validation
+    if not all([title, amount, transaction_type in TRANSACTION_TYPES, is_category(category_id)]):
+        return None, 'Por favor, preencha todos os campos obrigatórios.'
+    
+    try:
+        amount = Decimal(amount)
+        # The amount column is NUMERIC(10, 2), so anything from 1e8 up would overflow on insert
+        if not amount.is_finite() or amount <= 0 or amount >= MAX_AMOUNT:
+            raise ValueError("Amount must be positive and fit the amount column")
+    except (ValueError, TypeError, ArithmeticError):
+        return None, 'Por favor, digite um valor positivo válido.'
+    
+    try:
+        date_obj = parse_date(transaction_date) if transaction_date else datetime.now().date()
+    except ValueError:
+        return None, 'Por favor, digite uma data válida.'
+    
+    return {
+        'title': title,
+        'amount': amount,
+        'transaction_type': transaction_type,
+        'category_id': category_id,
+        'description': description,
+        'transaction_date': date_obj
+    }, None
+
+def month_bounds(year, month):
+    """Return the half-open [start, end) date range covering a month"""
+    start = datetime(year, month, 1).date()
+    if month == 12:
+        end = datetime(year + 1, 1, 1).date()
+    else:
+        end = datetime(year, month + 1, 1).date()
+    return start, end
 
 @app.route('/')
 def index():
@@ -73,75 +95,126 @@ def dashboard():
     user_id = current_user.id
     
     # Get current month data
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-    
-    # Calculate totals
-    income_total = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_type == 'income',
-        extract('month', Transaction.transaction_date) == current_month,
-        extract('year', Transaction.transaction_date) == current_year
-    ).scalar() or Decimal('0.00')
+    now = datetime.now()
+    current_month = now.month
+    current_year = now.year
     
-    expense_total = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_type == 'expense',
-        extract('month', Transaction.transaction_date) == current_month,
-        extract('year', Transaction.transaction_date) == current_year
-    ).scalar() or Decimal('0.00')
+    month_start = datetime(current_year, current_month, 1).date()
+    month_stats = build_dashboard_stats(user_id, month_start)
     
-    balance = income_total - expense_total
-    
-    # Get recent transactions
-    recent_transactions = Transaction.query.filter_by(user_id=user_id)\
+    # Get recent transactions, fetching only the columns the dashboard displays
+    recent_transactions = db.session.query(
+        Transaction.title,
+        Transaction.amount,
+        Transaction.transaction_type,
+        Transaction.transaction_date,
+        Category.name.label('category_name')
+    ).join(Transaction.category)\
+        .filter(Transaction.user_id == user_id)\
         .order_by(desc(Transaction.transaction_date))\
         .limit(5).all()
     
-    # Get expense breakdown by category
-    expense_categories = db.session.query(
-        Transaction.category,
-        func.sum(Transaction.amount).label('total')
-    ).filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_type == 'expense',
-        extract('month', Transaction.transaction_date) == current_month,
-        extract('year', Transaction.transaction_date) == current_year
-    ).group_by(Transaction.category).all()
-    
     return render_template('dashboard.html',
-                         income_total=float(income_total),
-                         expense_total=float(expense_total),
-                         balance=float(balance),
+                         income_total=month_stats['income_total'],
+                         expense_total=month_stats['expense_total'],
+                         balance=month_stats['balance'],
                          recent_transactions=recent_transactions,
-                         expense_categories=expense_categories,
-                         current_month=datetime.now().strftime('%B %Y'))
+                         expense_categories=month_stats['expense_categories'],
+                         current_month=now.strftime('%B %Y'))
+
+def build_dashboard_stats(user_id, month_start):
+    """Compute the dashboard totals and expense breakdown for one month"""
+    next_month_start = month_bounds(month_start.year, month_start.month)[1]
+    
+    # Read per-category totals, per-type subtotals and the net balance in one ROLLUP query
+    net_amount = case((Transaction.transaction_type == 'income', Transaction.amount),
+                      else_=-Transaction.amount)
+    month_rows = db.session.query(
+        Transaction.transaction_type,
+        Category.name,
+        cast(func.sum(Transaction.amount), Float),
+        cast(func.sum(net_amount), Float)
+    ).join(Transaction.category).filter(
+        Transaction.user_id == user_id,
+        Transaction.transaction_date >= month_start,
+        Transaction.transaction_date < next_month_start
+    ).group_by(func.rollup(Transaction.transaction_type, tuple_(Category.id, Category.name))).all()
+    
+    # Rows without a category are the subtotals for their type, the row without a type is the grand total
+    type_totals = {transaction_type: total for transaction_type, category, total, net in month_rows
+                   if category is None and transaction_type is not None}
+    # ROLLUP yields a grand total row even for an empty month, with a NULL sum
+    balance = next((net for transaction_type, category, total, net in month_rows
+                    if transaction_type is None), None) or 0.0
+    expense_categories = [(category, total) for transaction_type, category, total, net in month_rows
+                          if transaction_type == 'expense' and category is not None]
+    
+    return {
+        'income_total': type_totals.get('income', 0.0),
+        'expense_total': type_totals.get('expense', 0.0),
+        'balance': balance,
+        'expense_categories': expense_categories
+    }
+
+TRANSACTIONS_PER_PAGE = 20
 
 @app.route('/transactions')
 @require_login
 def transactions():
     """View all transactions with filtering"""
     user_id = current_user.id
-    page = request.args.get('page', 1, type=int)
-    category_filter = request.args.get('category', '')
+    category_filter = request.args.get('category', type=int)
     type_filter = request.args.get('type', '')
     
-    query = Transaction.query.filter_by(user_id=user_id)
+    # Keyset cursors: the last row of the previous page or the first row of the next one
+    after_date = request.args.get('after_date', type=parse_date)
+    after_id = request.args.get('after_id', type=int)
+    before_date = request.args.get('before_date', type=parse_date)
+    before_id = request.args.get('before_id', type=int)
+    
+    # Load categories with the page and fail loudly on any other lazy load instead of issuing N+1 queries
+    query = Transaction.query.options(joinedload(Transaction.category), raiseload('*'))\
+        .filter_by(user_id=user_id)
     
     if category_filter:
-        query = query.filter_by(category=category_filter)
+        query = query.filter_by(category_id=category_filter)
     
-    if type_filter:
+    if type_filter in TRANSACTION_TYPES:
         query = query.filter_by(transaction_type=type_filter)
     
-    transactions = query.order_by(desc(Transaction.transaction_date))\
-        .paginate(page=page, per_page=20, error_out=False)
+    # Fetch one extra row to know whether another page exists in that direction
+    position = tuple_(Transaction.transaction_date, Transaction.id)
+    if before_date and before_id:
+        rows = query.filter(position > tuple_(before_date, before_id))\
+            .order_by(Transaction.transaction_date, Transaction.id)\
+            .limit(TRANSACTIONS_PER_PAGE + 1).all()
+        has_prev = len(rows) > TRANSACTIONS_PER_PAGE
+        has_next = True
+        transactions = rows[:TRANSACTIONS_PER_PAGE][::-1]
+    else:
+        if after_date and after_id:
+            query = query.filter(position < tuple_(after_date, after_id))
+        rows = query.order_by(desc(Transaction.transaction_date), desc(Transaction.id))\
+            .limit(TRANSACTIONS_PER_PAGE + 1).all()
+        has_prev = bool(after_date and after_id)
+        has_next = len(rows) > TRANSACTIONS_PER_PAGE
+        transactions = rows[:TRANSACTIONS_PER_PAGE]
+    
+    next_cursor = prev_cursor = None
+    if transactions and has_next:
+        next_cursor = {'after_date': transactions[-1].transaction_date.isoformat(),
+                       'after_id': transactions[-1].id}
+    if transactions and has_prev:
+        prev_cursor = {'before_date': transactions[0].transaction_date.isoformat(),
+                       'before_id': transactions[0].id}
     
     # Get all categories for filter dropdown
-    categories = Category.query.all()
+    categories = get_categories()
     
     return render_template('transactions.html',
                          transactions=transactions,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor,
                          categories=categories,
                          category_filter=category_filter,
                          type_filter=type_filter)
@@ -151,44 +224,13 @@ def transactions():
 def add_transaction():
     """Add a new transaction"""
     if request.method == 'POST':
-        title = request.form.get('title', '').strip()
-        amount = request.form.get('amount', '').strip()
-        transaction_type = request.form.get('transaction_type', '').strip()
-        category = request.form.get('category', '').strip()
-        description = request.form.get('description', '').strip()
-        transaction_date = request.form.get('transaction_date', '').strip()
-        
-        # Validation
-        if not all([title, amount, transaction_type, category]):
-            flash('Por favor, preencha todos os campos obrigatórios.', 'error')
-            return redirect(url_for('add_transaction'))
-        
-        try:
-            amount = Decimal(amount)
-            if amount <= 0:
-                raise ValueError("Amount must be positive")
-        except (ValueError, TypeError):
-            flash('Por favor, digite um valor positivo válido.', 'error')
-            return redirect(url_for('add_transaction'))
-        
-        try:
-            if transaction_date:
-                date_obj = datetime.strptime(transaction_date, '%Y-%m-%d').date()
-            else:
-                date_obj = datetime.now().date()
-        except ValueError:
-            flash('Por favor, digite uma data válida.', 'error')
+        fields, error = parse_transaction_form(request.form)
+        if error:
+            flash(error, 'error')
             return redirect(url_for('add_transaction'))
         
         # Create transaction
-        transaction = Transaction()
-        transaction.user_id = current_user.id
-        transaction.title = title
-        transaction.amount = amount
-        transaction.transaction_type = transaction_type
-        transaction.category = category
-        transaction.description = description
-        transaction.transaction_date = date_obj
+        transaction = Transaction(user_id=current_user.id, **fields)
         
         db.session.add(transaction)
         db.session.commit()
@@ -197,55 +239,26 @@ def add_transaction():
         return redirect(url_for('transactions'))
     
     # GET request - show form
-    categories = Category.query.all()
+    categories = get_categories()
     return render_template('add_transaction.html', categories=categories, datetime=datetime)
 
 @app.route('/edit_transaction/<int:transaction_id>', methods=['GET', 'POST'])
 @require_login
 def edit_transaction(transaction_id):
     """Edit an existing transaction"""
-    transaction = Transaction.query.filter_by(
-        id=transaction_id, 
-        user_id=current_user.id
-    ).first_or_404()
+    transaction = db.session.get(Transaction, transaction_id, options=[raiseload('*')])
+    if transaction is None or transaction.user_id != current_user.id:
+        abort(404)
     
     if request.method == 'POST':
-        title = request.form.get('title', '').strip()
-        amount = request.form.get('amount', '').strip()
-        transaction_type = request.form.get('transaction_type', '').strip()
-        category = request.form.get('category', '').strip()
-        description = request.form.get('description', '').strip()
-        transaction_date = request.form.get('transaction_date', '').strip()
-        
-        # Validation
-        if not all([title, amount, transaction_type, category]):
-            flash('Please fill in all required fields.', 'error')
-            return redirect(url_for('edit_transaction', transaction_id=transaction_id))
-        
-        try:
-            amount = Decimal(amount)
-            if amount <= 0:
-                raise ValueError("Amount must be positive")
-        except (ValueError, TypeError):
-            flash('Please enter a valid positive amount.', 'error')
-            return redirect(url_for('edit_transaction', transaction_id=transaction_id))
-        
-        try:
-            if transaction_date:
-                date_obj = datetime.strptime(transaction_date, '%Y-%m-%d').date()
-            else:
-                date_obj = datetime.now().date()
-        except ValueError:
-            flash('Por favor, digite uma data válida.', 'error')
+        fields, error = parse_transaction_form(request.form)
+        if error:
+            flash(error, 'error')
             return redirect(url_for('edit_transaction', transaction_id=transaction_id))
         
         # Update transaction
-        transaction.title = title
-        transaction.amount = amount
-        transaction.transaction_type = transaction_type
-        transaction.category = category
-        transaction.description = description
-        transaction.transaction_date = date_obj
+        for name, value in fields.items():
+            setattr(transaction, name, value)
         
         db.session.commit()
         
@@ -253,7 +266,7 @@ def edit_transaction(transaction_id):
         return redirect(url_for('transactions'))
     
     # GET request - show form
-    categories = Category.query.all()
+    categories = get_categories()
     return render_template('edit_transaction.html', 
                          transaction=transaction, 
                          categories=categories,
@@ -263,10 +276,9 @@ def edit_transaction(transaction_id):
 @require_login
 def delete_transaction(transaction_id):
     """Delete a transaction"""
-    transaction = Transaction.query.filter_by(
-        id=transaction_id, 
-        user_id=current_user.id
-    ).first_or_404()
+    transaction = db.session.get(Transaction, transaction_id)
+    if transaction is None or transaction.user_id != current_user.id:
+        abort(404)
     
     db.session.delete(transaction)
     db.session.commit()
@@ -279,58 +291,85 @@ def delete_transaction(transaction_id):
 def reports():
     """Financial reports and charts"""
     user_id = current_user.id
+    now = datetime.now()
+    
+    report = build_report_stats(user_id, now)
     
+    return render_template('reports.html', **report)
+
+def build_report_stats(user_id, now):
+    """Compute the monthly history and yearly category breakdown for reports"""
     # Get monthly data for the last 12 months
+    month_dates = []
+    year, month = now.year, now.month
+    for _ in range(12):
+        month_dates.append(datetime(year, month, 1).date())
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    month_dates.reverse()
+    start_date = month_dates[0]
+    end_date = month_bounds(now.year, now.month)[1]
+    
+    # Sum income, expense and balance per month in a single query
+    month_col = cast(func.date_trunc('month', Transaction.transaction_date), Date)
+    income_sum = func.sum(case((Transaction.transaction_type == 'income', Transaction.amount), else_=0))
+    expense_sum = func.sum(case((Transaction.transaction_type == 'expense', Transaction.amount), else_=0))
+    balance_sum = func.sum(case((Transaction.transaction_type == 'income', Transaction.amount),
+                                else_=-Transaction.amount))
+    monthly_rows = db.session.query(
+        month_col,
+        cast(income_sum, Float),
+        cast(expense_sum, Float),
+        cast(balance_sum, Float)
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.transaction_date >= start_date,
+        Transaction.transaction_date < end_date
+    ).group_by(month_col).all()
+    
+    monthly_totals = {
+        month: (income, expense, balance)
+        for month, income, expense, balance in monthly_rows
+    }
+    
     monthly_data = []
-    for i in range(11, -1, -1):
-        date = datetime.now() - timedelta(days=30 * i)
-        month = date.month
-        year = date.year
-        
-        income = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == 'income',
-            extract('month', Transaction.transaction_date) == month,
-            extract('year', Transaction.transaction_date) == year
-        ).scalar() or Decimal('0.00')
-        
-        expense = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == 'expense',
-            extract('month', Transaction.transaction_date) == month,
-            extract('year', Transaction.transaction_date) == year
-        ).scalar() or Decimal('0.00')
+    for date in month_dates:
+        income, expense, balance = monthly_totals.get(date, (0.0, 0.0, 0.0))
         
         monthly_data.append({
             'month': date.strftime('%b %Y'),
-            'income': float(income),
-            'expense': float(expense),
-            'balance': float(income - expense)
+            'income': income,
+            'expense': expense,
+            'balance': balance
         })
     
     # Get category breakdown for current year
-    current_year = datetime.now().year
+    current_year = now.year
+    year_start = datetime(current_year, 1, 1).date()
+    next_year_start = datetime(current_year + 1, 1, 1).date()
     
     income_categories = db.session.query(
-        Transaction.category,
+        Category.name,
         func.sum(Transaction.amount).label('total')
-    ).filter(
+    ).join(Transaction.category).filter(
         Transaction.user_id == user_id,
         Transaction.transaction_type == 'income',
-        extract('year', Transaction.transaction_date) == current_year
-    ).group_by(Transaction.category).all()
+        Transaction.transaction_date >= year_start,
+        Transaction.transaction_date < next_year_start
+    ).group_by(Category.id, Category.name).all()
     
     expense_categories = db.session.query(
-        Transaction.category,
+        Category.name,
         func.sum(Transaction.amount).label('total')
-    ).filter(
+    ).join(Transaction.category).filter(
         Transaction.user_id == user_id,
         Transaction.transaction_type == 'expense',
-        extract('year', Transaction.transaction_date) == current_year
-    ).group_by(Transaction.category).all()
-    
-    return render_template('reports.html',
-                         monthly_data=monthly_data,
-                         income_categories=income_categories,
-                         expense_categories=expense_categories,
-                         current_year=current_year)
+        Transaction.transaction_date >= year_start,
+        Transaction.transaction_date < next_year_start
+    ).group_by(Category.id, Category.name).all()
+    
+    return {
+        'monthly_data': monthly_data,
+        'income_categories': income_categories,
+        'expense_categories': expense_categories,
+        'current_year': current_year
+    }
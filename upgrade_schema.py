@@ -0,0 +1,74 @@
+"""One-off upgrade for databases created before transactions stored
+transaction_type as the tx_type ENUM and category as category_id.
+
+Run it once before deploying the new code: python upgrade_schema.py
+"""
+import logging
+
+from sqlalchemy import inspect, text
+
+from app import app, db
+from models import Transaction, transaction_type_enum
+
+# Arbitrary key shared by every process running this upgrade
+UPGRADE_LOCK_KEY = 4620731
+
+def upgrade_transactions_schema():
+    """Convert a transactions table that still stores type and category as strings"""
+    # Serialize concurrent runs; the lock is released when the transaction ends
+    db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': UPGRADE_LOCK_KEY})
+    
+    # Check the columns only after taking the lock, another run may have finished meanwhile
+    columns = {column['name'] for column in inspect(db.session.connection()).get_columns('transactions')}
+    if 'category' not in columns:
+        db.session.rollback()
+        logging.info("Transactions table is already upgraded")
+        return
+    
+    # The partial type indexes depend on the column being rewritten
+    for name in ('ix_tx_income_user_date', 'ix_tx_expense_user_date'):
+        db.session.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    
+    # Types were never validated before, so map anything unknown to 'expense' ahead of the cast
+    result = db.session.execute(text("""
+        UPDATE transactions SET transaction_type = 'expense'
+        WHERE transaction_type NOT IN ('income', 'expense')
+    """))
+    if result.rowcount:
+        logging.warning("Mapped %d transactions with an unknown type to 'expense'", result.rowcount)
+    
+    transaction_type_enum.create(db.session.connection(), checkfirst=True)
+    db.session.execute(text("""
+        ALTER TABLE transactions
+        ALTER COLUMN transaction_type TYPE tx_type USING transaction_type::tx_type
+    """))
+    
+    # Backfill category_id by name; unknown names fall back to the generic category of their type
+    db.session.execute(text("""
+        ALTER TABLE transactions ADD COLUMN category_id INTEGER REFERENCES categories (id)
+    """))
+    db.session.execute(text("""
+        UPDATE transactions t SET category_id = c.id
+        FROM categories c WHERE c.name = t.category
+    """))
+    result = db.session.execute(text("""
+        UPDATE transactions t SET category_id = c.id
+        FROM categories c
+        WHERE t.category_id IS NULL
+          AND c.name = CASE WHEN t.transaction_type = 'income'
+                            THEN 'Outras Receitas' ELSE 'Outras Despesas' END
+    """))
+    if result.rowcount:
+        logging.warning("Mapped %d transactions with an unknown category to "
+                        "'Outras Receitas'/'Outras Despesas'", result.rowcount)
+    db.session.execute(text("ALTER TABLE transactions ALTER COLUMN category_id SET NOT NULL"))
+    db.session.execute(text("ALTER TABLE transactions DROP COLUMN category"))
+    
+    for index in Transaction.__table__.indexes:
+        index.create(db.session.connection(), checkfirst=True)
+    db.session.commit()
+    logging.info("Transactions table upgraded")
+
+if __name__ == "__main__":
+    with app.app_context():
+        upgrade_transactions_schema()